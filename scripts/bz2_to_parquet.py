@@ -3,24 +3,61 @@ bz2_to_parquet.py
 
 Convert all top-level *.bz2 (CSV or JSONL) in a directory into ONE Parquet file.
 
-- Install: pip install pandas pyarrow
+- Install: pip install pyarrow
 - No recursion
-- Large, streaming chunks
-- ZSTD compression w/ configurable level (e.g., 22)
-- Dictionary encoding for strings
-- Optional type coercion to tighten schema
+- Large, streaming chunks parsed by PyArrow's multithreaded C++ CSV/JSON readers (no pandas parser)
+- bz2 read through a large (4 MiB) buffer instead of pandas' small default reads
+- Page-cache hints where posix_fadvise exists: SEQUENTIAL on bz2 input (bigger readahead), DONTNEED on
+  each input once converted and on the outputs, so TBs read once don't evict everything else
+- Optional parallel bz2 decode of a single file with indexed_bzip2 (pip install indexed_bzip2): bzip2
+  blocks are independent, so it decodes them on --threads cores; used automatically when installed.
+  Otherwise lbzip2/pbzip2 on PATH decode in a separate process and hand bytes over a pipe
+  (no GIL, no Python copy loop); pbzip2 only decodes in parallel the files it compressed itself
+- ZSTD compression w/ configurable level (default 9). The bz2 -> Arrow decode already saturates a core,
+  and zstd's ratio/time Pareto knee sits near 10–15, so 22 mostly buys hours of CPU for ~1–3% size.
+  Tiers: 1–5 realtime, 9–15 balanced, 19–22 archival batch jobs. Levels are clamped per codec
+  (gzip 1–9, brotli 0–11) and not passed at all to snappy/none, which reject them
+  --auto-level probes levels 3/9/15/19/22 on a 64 MiB sample of the real data and uses the lowest
+  level within 2% of level 22's size
+- No zstd long-distance mode (--long / windowLog 27): Parquet compresses every ~1 MiB page on its own,
+  so a 128 MiB match window has nothing to reach, and neither PyArrow nor DuckDB exposes it. Cross-row
+  repetition (authors, subreddits) is captured by the dictionary/delta encodings instead
+- Decode and write overlap: a background thread decodes bz2 + parses up to --pipeline-depth chunks ahead
+  while the main thread encodes/compresses (both release the GIL in C)
+- Optional parallel compression (--zstd-workers N): PyArrow's zstd is single-threaded per column
+  chunk and doesn't expose ZSTD_c_nbWorkers, so N writer threads each compress their own part file
+  (OUT-part000.parquet, ...) concurrently; read them back as one dataset
+- Optional parallel decode (--jobs N): bz2 is single-threaded per stream, so N processes each convert
+  whole files into shards OUT-<file>.parquet sharing one schema (a standard PyArrow dataset).
+  Each worker gets cpu_count // jobs Arrow threads unless --threads is set, so N processes don't
+  each spin up a full-machine thread pool
+- Dictionary encoding decided per column from a sample: low-cardinality columns
+  (author, subreddit, score) get a dictionary, near-unique ones (body, id, created_utc) skip the wasted hash build
+- Per-column encodings for the rest: DELTA_BINARY_PACKED for integers (timestamps, ids),
+  DELTA_BYTE_ARRAY for short strings (ids share prefixes), DELTA_LENGTH_BYTE_ARRAY for long text (body)
+- Row groups sized by bytes (--row-group-bytes, default 128 MiB uncompressed) rather than a fixed row
+  count: rows/group = target / bytes-per-row of the first chunk (~320k rows for ~400 B Reddit comments)
+- Parquet page index + ~1 MB data pages, so readers can skip to individual pages
+  (predicate pushdown / point lookups on wide text touch a tiny fraction of the file)
+- Bounded page buffers: 1 MiB data pages, 2 MiB dictionary page limit, v2 data pages. Keeps the
+  writer's per-column buffers small and avoids mid-row-group dictionary fallback spikes, which
+  keeps RAM flat on the 90 GB case
+- Optional type coercion to tighten schema (Arrow compute kernels), or a declared schema
+  (--schema-json; dump a sampled one with --save-schema-json) that readers parse straight into
+- Optional projection (--columns author,subreddit,body,...): CSV readers never convert the other
+  columns; JSONL drops them right after parsing, before coercion, dictionary sampling and compression
 
 Examples
 --------
-Auto-detect (CSV or JSONL), use max zstd:
+Auto-detect (CSV or JSONL), default zstd level 9:
 
-    python duckdb_bz2_to_parquet.py \
+    python bz2_to_parquet.py \
         -i "/data/top" \
         -o "/data/out/all.parquet"
 
-Explicit JSONL with 8 threads and bigger row groups:
+Explicit JSONL with 8 threads and bigger row groups, archival zstd:
 
-    python duckdb_bz2_to_parquet.py \
+    python bz2_to_parquet.py \
         -i "/Volumes/alienHD/5_files_2TB_reddit_comments" \
         -o "/Volumes/alienHD/test2/out.parquet" \
         --format jsonl \
@@ -33,18 +70,46 @@ Explicit JSONL with 8 threads and bigger row groups:
 
 from __future__ import annotations
 import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
+import os
 import sys
 import bz2
-import pandas as pd
-import numpy as np
+import csv
+import io
+import json
+import queue
+import re
+import shutil
+import subprocess
+import threading
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.json as pajson
 import pyarrow.parquet as pq
 
+try:
+    import indexed_bzip2  # optional: multithreaded bz2 decoder
+except ImportError:
+    indexed_bzip2 = None
 
 
 # ---------- CLI ----------
 
+SIZE_UNITS = {"": 1, "B": 1, "KB": 10**3, "MB": 10**6, "GB": 10**9,
+              "KIB": 1 << 10, "MIB": 1 << 20, "GIB": 1 << 30}
+
+def parse_size(text: str) -> int:
+    # "128MiB" -> 134217728; plain integers are bytes
+    t = str(text).strip().upper()
+    num = t.rstrip("KMGIB")
+    unit = t[len(num):]
+    if unit not in SIZE_UNITS:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+    return int(float(num) * SIZE_UNITS[unit])
+
 def parse_args():
     p = argparse.ArgumentParser(
         description="Convert top-level .bz2 files (CSV/JSONL) in a directory into one Parquet (PyArrow)."
@@ -55,8 +120,14 @@ def parse_args():
                    help="Output Parquet file.")
     p.add_argument("--format", choices=["auto", "csv", "jsonl"], default="auto",
                    help="Content format inside .bz2 (default: auto).")
-    p.add_argument("--chunksize", type=int, default=1_000_000,
-                   help="Rows per chunk to stream (default: 1,000,000).")
+    p.add_argument("--block-size", type=int, default=64 << 20,
+                   help="Bytes of decompressed input parsed per chunk (default: 64 MiB).")
+    p.add_argument("--read-buffer-size", type=int, default=4 << 20,
+                   help="Read buffer in bytes for decompressed bz2 input (default: 4 MiB).")
+    p.add_argument("--decoder", choices=["auto", "python", "indexed_bzip2", "lbzip2", "pbzip2"],
+                   default="auto",
+                   help="bz2 decoder: Python's single-threaded bz2, indexed_bzip2 on --threads cores, or an "
+                        "lbzip2/pbzip2 subprocess (default: auto = first available of those, else python).")
 
     # CSV knobs (only used when --format csv or auto-detected csv)
     p.add_argument("--csv-sep", default=",", help='CSV delimiter (default: ",")')
@@ -67,147 +138,1011 @@ def parse_args():
     # Parquet / perf knobs
     p.add_argument("--parquet-compression", choices=["zstd", "snappy", "gzip", "brotli", "none"],
                    default="zstd", help="Parquet compression codec (default: zstd)")
-    p.add_argument("--compression-level", type=int, default=22,
-                   help="Compression level for zstd/gzip/brotli (e.g., 22 for zstd).")
-    p.add_argument("--row-group-size", type=int, default=1_000_000,
-                   help="Target Parquet row group size (default: 1,000,000).")
+    p.add_argument("--compression-level", type=int, default=9,
+                   help="Compression level for zstd/gzip/brotli (default: 9). zstd: 1–5 realtime, "
+                        "9–15 balanced, 19–22 archival; clamped to gzip 1–9 / brotli 0–11.")
+    p.add_argument("--auto-level", action="store_true",
+                   help="Probe zstd levels on a sample of the first file and use the lowest one "
+                        "within --auto-level-tolerance of level 22's size (overrides --compression-level).")
+    p.add_argument("--auto-level-sample", type=parse_size, default="64MiB",
+                   help="Decompressed bytes sampled for --auto-level (default: 64MiB).")
+    p.add_argument("--auto-level-tolerance", type=float, default=0.02,
+                   help="Allowed size increase over level 22 for --auto-level (default: 0.02).")
+    p.add_argument("--row-group-bytes", type=parse_size, default="128MiB",
+                   help="Target uncompressed row group size, e.g. 64MiB or 1GiB (default: 128MiB). "
+                        "Rows per group are derived from the first chunk's bytes/row.")
+    p.add_argument("--row-group-size", type=int, default=None,
+                   help="Fixed rows per row group instead of --row-group-bytes (0 = PyArrow default).")
+    p.add_argument("--data-page-size", "--page-size", type=int, default=1 << 20,
+                   help="Target Parquet data page size in bytes (default: 1 MiB).")
+    p.add_argument("--dictionary-page-size", type=int, default=2 << 20,
+                   help="Dictionary page limit in bytes before falling back to plain (default: 2 MiB).")
+    p.add_argument("--data-page-version", choices=["1.0", "2.0"], default="2.0",
+                   help="Parquet data page format (default: 2.0).")
+    p.add_argument("--no-page-index", action="store_true",
+                   help="Do not write the Parquet page index (column/offset indexes).")
+    p.add_argument("--pipeline-depth", type=int, default=4,
+                   help="Chunks decoded ahead by a background thread while the writer compresses "
+                        "(default: 4, 0 = decode and write in turn).")
+    p.add_argument("--zstd-workers", type=int, default=1,
+                   help="Writer threads compressing in parallel; >1 writes N part files "
+                        "next to the output instead of one file (default: 1).")
+    p.add_argument("--jobs", type=int, default=1,
+                   help="bz2 files decoded in parallel processes, each writing its own shard "
+                        "OUT-<file>.parquet (default: 1 = one output file; 0 = cpu_count - 1).")
     p.add_argument("--threads", type=int, default=0,
-                   help="Hint for PyArrow CPU threads (0 = default).")
+                   help="Hint for PyArrow CPU threads, per job with --jobs "
+                        "(0 = default; cpu_count // jobs with --jobs).")
     p.add_argument("--no-dict", action="store_true", help="Disable dictionary encoding for strings.")
+    p.add_argument("--dict-sample-size", type=int, default=1024,
+                   help="Values per string column sampled to decide dictionary encoding (default: 1024).")
+    p.add_argument("--dict-threshold", type=float, default=0.8,
+                   help="Dictionary-encode a string/integer column if distinct/sampled is below this (default: 0.8).")
+    p.add_argument("--no-dict-columns", default="body",
+                   help="Comma-separated columns never dictionary-encoded (default: body).")
+    p.add_argument("--column-encoding", default="",
+                   help="Comma-separated col=ENCODING overrides, e.g. created_utc=DELTA_BINARY_PACKED,body=PLAIN.")
+    p.add_argument("--no-column-encoding", action="store_true",
+                   help="Disable per-column DELTA_* encodings (non-dictionary columns stay PLAIN).")
     p.add_argument("--no-coerce", action="store_true",
                    help="Disable type coercion heuristics (leave strings as-is).")
+    p.add_argument("--columns", default="",
+                   help="Comma-separated columns to keep, in output order (default: all). Headerless CSV "
+                        "columns are named f0, f1, ...; columns missing from the data are written as null.")
+    p.add_argument("--schema-json", metavar="FILE",
+                   help='Declared output schema, a JSON object {"column": "arrow type", ...} in column order '
+                        '(e.g. {"id": "string", "created_utc": "int64", "gildings": "struct<gid_1: int64>"}; '
+                        'types as PyArrow prints them). Skips sampling and coercion.')
+    p.add_argument("--save-schema-json", metavar="FILE",
+                   help="Write the schema in use (declared or sampled) as JSON for reuse with --schema-json.")
     return p.parse_args()
 
 
 # ---------- Helpers ----------
 
 def list_bz2_top_level(d: Path):
-    return sorted([p for p in d.glob("*.bz2") if p.is_file()])
+    # scandir's is_file() comes from the directory entry, no stat() per file
+    with os.scandir(d) as it:
+        return sorted(Path(e.path) for e in it if e.name.endswith(".bz2") and e.is_file())
 
 def detect_format(files) -> str:
-    # Filename hints first
+    # Filename hints first: one pass, first hinted file decides
     for f in files:
         n = f.name.lower()
         if n.endswith((".jsonl.bz2", ".ndjson.bz2")):
             return "jsonl"
-    for f in files:
-        n = f.name.lower()
         if n.endswith(".csv.bz2"):
             return "csv"
-    # Sniff first non-empty line of a bz2 file
+    # Sniff the first non-whitespace byte of a small binary peek (no text decoding, no line loop)
     try:
-        with bz2.open(files[0], "rt", encoding="utf-8", errors="ignore") as fh:
-            for line in fh:
-                s = line.strip()
-                if not s:
-                    continue
-                return "jsonl" if s[:1] in ("{", "[") else "csv"
+        with bz2.open(files[0], "rb") as fh:
+            head = fh.read(4096)
     except Exception:
+        return "csv"  # safe fallback
+    head = head.removeprefix(b"\xef\xbb\xbf").lstrip(b" \t\r\n")
+    return "jsonl" if head[:1] in (b"{", b"[") else "csv"
+
+DECODER_TOOLS = ("lbzip2", "pbzip2")
+
+def resolve_decoder(name: str) -> str:
+    if name == "auto":
+        if indexed_bzip2 is not None:
+            return "indexed_bzip2"
+        return next((t for t in DECODER_TOOLS if shutil.which(t)), "python")
+    if name == "indexed_bzip2" and indexed_bzip2 is None:
+        raise SystemExit("--decoder indexed_bzip2 needs: pip install indexed_bzip2")
+    if name in DECODER_TOOLS and not shutil.which(name):
+        raise SystemExit(f"--decoder {name}: not found on PATH")
+    return name
+
+class DecoderPipe(io.RawIOBase):
+    """Raw stream over an external decoder's stdout; close() reaps the process."""
+
+    def __init__(self, proc: subprocess.Popen):
+        self.proc = proc
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.proc.stdout.readinto(b)
+        self.eof = self.eof or not n
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.proc.stdout.close()  # an early close ends the decoder with SIGPIPE
+            code = self.proc.wait()
+            if self.eof and code != 0:
+                raise OSError(f"{self.proc.args[0]} exited with status {code}")
+        finally:
+            super().close()
+
+def fadvise(target, advice: str):
+    # Page-cache hint on an fd or a path; a no-op where posix_fadvise is missing (macOS, Windows)
+    flag = getattr(os, advice, None)
+    if flag is None or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        if isinstance(target, int):
+            os.posix_fadvise(target, 0, 0, flag)
+            return
+        fd = os.open(target, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, flag)
+        finally:
+            os.close(fd)
+    except OSError:
         pass
-    return "csv"  # safe fallback
 
-def iter_chunks_csv(path: Path, chunksize: int, sep: str, header: bool, encoding: str):
-    header_arg = 0 if header else None
+def open_bz2(path: Path, buffer_size: int, decoder: str = "python"):
+    if decoder == "indexed_bzip2":
+        # Decodes bz2 blocks in parallel on as many threads as Arrow was given
+        return indexed_bzip2.open(str(path), parallelization=max(1, pa.cpu_count()))
+    if decoder in DECODER_TOOLS:
+        n = max(1, pa.cpu_count())
+        threads = ["-n", str(n)] if decoder == "lbzip2" else [f"-p{n}"]
+        proc = subprocess.Popen([decoder, "-dc", *threads, str(path)], stdout=subprocess.PIPE, bufsize=0)
+        return io.BufferedReader(DecoderPipe(proc), buffer_size=buffer_size)
+    # Large buffered reads amortize per-call decode overhead vs. many tiny reads
+    raw = bz2.BZ2File(path, "rb")
+    fadvise(raw.fileno(), "POSIX_FADV_SEQUENTIAL")
+    return io.BufferedReader(raw, buffer_size=buffer_size)
+
+def probe_zstd_level(path: Path, sample_bytes: int, buffer_size: int, tolerance: float,
+                     decoder: str = "python", levels=(3, 9, 15, 19, 22)) -> int:
+    # Same zstd that ParquetWriter uses; one-time cost of seconds vs. hours on the full run
+    with open_bz2(path, buffer_size, decoder) as fh:
+        sample = fh.read(sample_bytes)
+    if not sample:
+        return levels[-1]
+    sizes, speeds = {}, {}
+    for level in levels:
+        t0 = time.time()
+        sizes[level] = pa.Codec("zstd", compression_level=level).compress(sample).size
+        secs = time.time() - t0
+        speeds[level] = len(sample) / (1 << 20) / secs if secs > 0 else float("inf")
+    ref = sizes[levels[-1]]
+    print(f"zstd level probe on {len(sample) / (1 << 20):.0f} MiB of {path.name}:")
+    print(f"  {'level':>5}  {'size':>12}  {'vs ' + str(levels[-1]):>7}  {'MB/s':>7}")
+    for level in levels:
+        print(f"  {level:>5}  {sizes[level]:>12,}  {sizes[level] / ref:>7.3f}  {speeds[level]:>7.1f}")
+    best = min(l for l in levels if sizes[l] <= ref * (1 + tolerance))
+    print(f"→ Using zstd level {best}")
+    return best
+
+def widen_null_types(schema: pa.Schema) -> pa.Schema:
+    # All-null columns infer as type null; store them as string so later values still fit
+    return pa.schema(
+        [f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in schema],
+        metadata=schema.metadata,
+    )
+
+def _split_top(text: str):
+    # Split on commas outside <...>, [...] and (...)
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch in "<[(":
+            depth += 1
+        elif ch in ">])":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return [p for p in parts if p]
+
+def _parse_field(text: str) -> pa.Field:
+    name, _, type_text = text.partition(": ")
+    nullable = not type_text.endswith(" not null")
+    if not nullable:
+        type_text = type_text[:-len(" not null")]
+    return pa.field(name, parse_arrow_type(type_text), nullable)
+
+def parse_arrow_type(text: str) -> pa.DataType:
+    """Inverse of str(DataType): aliases plus the nested, tz-aware and dictionary forms."""
+    text = text.strip()
+    head, sep, rest = text.partition("<")
+    if sep and text.endswith(">"):
+        inner = rest[:-1]
+        if head == "struct":
+            return pa.struct([_parse_field(p) for p in _split_top(inner)])
+        if head == "list":
+            return pa.list_(_parse_field(inner))
+        if head == "large_list":
+            return pa.large_list(_parse_field(inner))
+        if head == "map":
+            key, item = _split_top(inner)
+            return pa.map_(parse_arrow_type(key), parse_arrow_type(item))
+        if head == "dictionary":
+            opts = dict(p.split("=", 1) for p in _split_top(inner))
+            return pa.dictionary(parse_arrow_type(opts["indices"]), parse_arrow_type(opts["values"]),
+                                 ordered=opts.get("ordered") == "1")
+    if text.startswith("timestamp[") and text.endswith("]"):
+        unit, _, tz = text[len("timestamp["):-1].partition(", tz=")
+        return pa.timestamp(unit, tz or None)
+    if text.startswith("decimal128(") and text.endswith(")"):
+        precision, scale = text[len("decimal128("):-1].split(",")
+        return pa.decimal128(int(precision), int(scale))
     try:
-        rdr = pd.read_csv(
-            path,
-            compression="infer",  # bz2
-            sep=sep,
-            header=header_arg,
-            encoding=encoding,
-            chunksize=chunksize,
-            low_memory=False,
+        return pa.type_for_alias(text)
+    except ValueError:
+        raise ValueError(f"Unsupported Arrow type in schema JSON: {text!r}") from None
+
+def load_schema_json(path) -> pa.Schema:
+    with open(path, encoding="utf-8") as fh:
+        spec = json.load(fh)
+    return pa.schema([(name, parse_arrow_type(t)) for name, t in spec.items()])
+
+def save_schema_json(schema: pa.Schema, path):
+    spec = {}
+    for f in schema:
+        text = str(f.type)
+        try:
+            ok = parse_arrow_type(text).equals(f.type)
+        except (ValueError, KeyError, TypeError):
+            ok = False
+        if not ok:
+            raise ValueError(f"Column {f.name!r}: type {text} cannot be saved to schema JSON")
+        spec[f.name] = text
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(spec, fh, indent=2)
+
+class ReplayStream(io.RawIOBase):
+    """Raw stream that serves `head` (already read off `fh`) before the rest of `fh`."""
+
+    def __init__(self, head: bytes, fh):
+        self.head = memoryview(head)
+        self.fh = fh
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.head:
+            return self.fh.readinto(b)
+        n = min(len(b), len(self.head))
+        b[:n] = self.head[:n]
+        self.head = self.head[n:]
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.fh.close()
+        finally:
+            super().close()
+
+def read_first_record(fh, limit: int) -> bytes:
+    # Whole lines up to the end of the first record: a quoted field may hold newlines, and
+    # quotes (doubled "" included) balance only at a record's end
+    head = fh.readline()
+    while head.count(b'"') % 2 and len(head) < limit:
+        line = fh.readline()
+        if not line:
+            break
+        head += line
+    return head
+
+def open_csv_reader(path: Path, block_size: int, sep: str, header: bool, encoding: str,
+                    buffer_size: int, schema=None, include_columns=None, decoder="python"):
+    # Returns (fh, reader), or (None, None) for an empty file
+    fh = open_bz2(path, buffer_size, decoder)
+    try:
+        first = read_first_record(fh, block_size)
+        if not first.strip():
+            fh.close()
+            return None, None
+        if schema is not None:
+            column_types = {f.name: f.type for f in schema}
+        else:
+            # Types from the first block would be fixed for the whole stream, so a later value
+            # of another type (bool column holding 1420070500.5) would fail mid-file. Read every
+            # column as string; plan_writer / coerce_chunk choose the types.
+            names = next(csv.reader(io.StringIO(first.decode(encoding, errors="replace")),
+                                    delimiter=sep))
+            if not header:
+                names = [f"f{i}" for i in range(len(names))]  # Arrow's autogenerated names
+            column_types = {name: pa.string() for name in names}
+        fh = ReplayStream(first, fh)
+        rdr = pacsv.open_csv(
+            fh,
+            read_options=pacsv.ReadOptions(
+                block_size=block_size,
+                encoding=encoding,
+                autogenerate_column_names=not header,
+            ),
+            parse_options=pacsv.ParseOptions(delimiter=sep, newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(
+                column_types=column_types,
+                include_columns=include_columns,
+                include_missing_columns=include_columns is not None,
+                strings_can_be_null=True,  # empty field -> null, as pandas read it
+            ),
         )
-        for chunk in rdr:
-            yield chunk
-    except pd.errors.EmptyDataError:
+    except Exception:
+        fh.close()
+        raise
+    return fh, rdr
+
+def iter_chunks_csv(path: Path, block_size: int, sep: str, header: bool, encoding: str,
+                    buffer_size: int, schema=None, decoder="python", columns=None):
+    # Declared schema: parse straight into it, skipping undeclared columns
+    include_columns = schema.names if schema is not None else columns
+    fh, rdr = open_csv_reader(path, block_size, sep, header, encoding, buffer_size,
+                              schema, include_columns, decoder)
+    if fh is None:
         return
+    with fh:
+        for batch in rdr:
+            yield pa.Table.from_batches([batch])
 
-def iter_chunks_jsonl(path: Path, chunksize: int):
-    try:
-        rdr = pd.read_json(
-            path,
-            compression="infer",
-            lines=True,
-            chunksize=chunksize,
+def iter_line_blocks(fh, block_size: int):
+    # Cut the stream into ~block_size byte blocks that end on a newline
+    tail = b""
+    while True:
+        buf = fh.read(block_size)
+        if not buf:
+            break
+        buf = tail + buf
+        cut = buf.rfind(b"\n")
+        if cut < 0:
+            tail = buf
+            continue
+        tail = buf[cut + 1:]
+        yield buf[:cut + 1]
+    if tail.strip():
+        yield tail
+
+def project_columns(table: pa.Table, columns) -> pa.Table:
+    # Requested columns in order; absent ones are all-null (typed like any all-null column)
+    present = set(table.column_names)
+    return pa.table({c: table.column(c) if c in present else pa.nulls(table.num_rows) for c in columns})
+
+def read_json_fallback(block: bytes, path: Path, first_row: int) -> pa.Table:
+    # Arrow fixes a column's type from its first value in the block and rejects later values
+    # of another type. Parse such a block with json instead: booleans mixed with numbers become
+    # 0.0/1.0 as pandas read them (Reddit's "edited": false or an epoch float), other mixed
+    # columns are kept as text for coerce_chunk / ensure_columns to settle.
+    rows = []
+    for line in block.splitlines():
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"{path.name}: row {first_row + len(rows) + 1:,}: {e}") from None
+        if not isinstance(row, dict):
+            raise ValueError(f"{path.name}: row {first_row + len(rows) + 1:,}: not a JSON object")
+        rows.append(row)
+    arrays = {}
+    for key in dict.fromkeys(k for row in rows for k in row):
+        values = [row.get(key) for row in rows]
+        kinds = {type(v) for v in values if v is not None}
+        if bool in kinds and len(kinds) > 1 and kinds <= {bool, int, float}:
+            values = [float(v) if isinstance(v, bool) else v for v in values]
+            kinds = {float} | (kinds - {bool})
+        if len(kinds) <= 1 or kinds == {int, float}:  # pa.array would turn True into 1.0 otherwise
+            try:
+                arrays[key] = pa.array(values)
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                pass
+        arrays[key] = pa.array(
+            [v if v is None or isinstance(v, str) else json.dumps(v) for v in values], pa.string()
         )
-        for chunk in rdr:
-            yield chunk
+    return pa.table(arrays)
+
+# Arrow's message for a top-level field holding both booleans and numbers within one block
+BOOL_NUMBER_DRIFT = re.compile(r"Column\(/([^/)]+)\) changed from (?:boolean to number|number to boolean)")
+
+
+def bools_to_numbers(block: bytes, keys) -> bytes:
+    # true/false -> 1/0 for `keys`, as pandas read a column mixing them with numbers. A JSON
+    # string can't contain an unescaped '"key":', so only real keys match (nested ones with
+    # the same name too). Other spacings still fail Arrow and take read_json_fallback.
+    for key in keys:
+        name = json.dumps(key).encode()
+        for sep in (b":", b": "):
+            if name + sep not in block:
+                continue
+            block = block.replace(name + sep + b"false", name + sep + b"0")
+            block = block.replace(name + sep + b"true", name + sep + b"1")
+    return block
+
+
+def keep_key_order(table: pa.Table, block: bytes) -> pa.Table:
+    # explicit_schema fields come first in read_json's output; put them back in the order the
+    # first row has them, as the parse without a pinned field would have
+    try:
+        first = json.loads(block[:block.find(b"\n")] if b"\n" in block else block)
     except ValueError:
-        return
+        return table
+    names = set(table.column_names)
+    order = [k for k in first if k in names]
+    seen = set(order)
+    return table.select(order + [c for c in table.column_names if c not in seen])
+
+
+def read_json_block(block: bytes, path: Path, first_row: int, pinned, numeric: set) -> pa.Table:
+    # `numeric` holds the keys this file has mixed booleans and numbers in; found once, they are
+    # rewritten and pinned to float64 before parsing, so later blocks skip the attempt bound to fail
+    while True:
+        data = bools_to_numbers(block, numeric) if numeric else block
+        fields = [*pinned, *(pa.field(k, pa.float64()) for k in numeric if k not in pinned.names)]
+        options = pajson.ParseOptions(explicit_schema=pa.schema(fields)) if fields else None
+        try:
+            table = pajson.read_json(pa.BufferReader(data), parse_options=options)
+            return keep_key_order(table, data) if numeric else table
+        except pa.ArrowInvalid as e:
+            drift = BOOL_NUMBER_DRIFT.search(str(e))
+            if drift is None or drift.group(1) in numeric or drift.group(1) in pinned.names:
+                return read_json_fallback(data, path, first_row)
+            numeric.add(drift.group(1))
 
-def coerce_chunk(df: pd.DataFrame) -> pd.DataFrame:
+def iter_chunks_jsonl(path: Path, block_size: int, buffer_size: int, schema=None, decoder="python",
+                      columns=None):
+    # One read_json per block (not a streaming reader) so each chunk infers its own types,
+    # like pandas' chunked reader did; schema drift is reconciled against the writer schema.
+    # A declared schema only pins string columns here: Arrow's JSON parser rejects quoted
+    # numbers (Reddit's "created_utc": "1420070400") for int fields, so those are cast later.
+    pinned = pa.schema([])
+    if schema is not None:
+        pinned = pa.schema([f for f in schema if is_string_type(f.type)])
+    numeric = set()
+    rows = 0
+    with open_bz2(path, buffer_size, decoder) as fh:
+        for block in iter_line_blocks(fh, block_size):
+            table = read_json_block(block, path, rows, pinned, numeric)
+            rows += table.num_rows
+            yield table if columns is None else project_columns(table, columns)
+
+INT_PATTERN = r'^[+-]?\d+$'
+FLOAT_PATTERN = r'^[+-]?((\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|inf|infinity|nan)$'
+# First characters that can start a value matching the patterns above / 'true' / 'false'
+NUMBER_STARTS = pa.array(list("+-.0123456789iInN"))
+BOOL_STARTS = pa.array(list("tTfF"))
+
+
+def _fraction(mask) -> float:
+    # Share of non-null values matching; all-null columns count as no match
+    return pc.mean(mask).as_py() or 0.0
+
+
+def _starts_in(first, value_set):
+    # is_in maps null to False; keep nulls null so the share matches the regex masks'
+    return pc.if_else(pc.is_null(first), None, pc.is_in(first, value_set=value_set))
+
+
+def _all(mask) -> bool:
+    # Every non-null value matches; all-null columns count as no match
+    return bool(pc.all(mask).as_py())
+
+
+def _set_lossless(table: pa.Table, i: int, name: str, col, converted) -> pa.Table:
+    # A coercion that turns a value into null is a bug, not a narrower type
+    if converted.null_count != col.null_count:
+        raise ValueError(f"coercing column {name!r} to {converted.type} would null "
+                         f"{converted.null_count - col.null_count:,} value(s)")
+    return table.set_column(i, name, converted)
+
+
+def coerce_chunk(table: pa.Table, columns=None) -> pa.Table:
     """
-    Tighten types safely:
-      - integer strings -> Int64[pyarrow]; if overflow and non-negative -> UInt64[pyarrow]; else keep as string
-      - decimal/scientific numbers -> Float64[pyarrow]
-      - 'true'/'false' -> boolean[pyarrow]
-    Falls back to string when overflow or mixed signs would lose precision.
+    Tighten types safely (Arrow compute kernels, no Python per-value work):
+      - integer strings -> int64; if overflow and non-negative -> uint64; else keep as string
+      - decimal/scientific numbers -> float64
+      - 'true'/'false' -> bool
+    Falls back to string when overflow or mixed signs would lose precision, and whenever any
+    non-null value doesn't convert: a coercion never writes a value as null.
+    `columns` limits the work to those names (default: every string column).
     """
-    df = df.convert_dtypes(dtype_backend="pyarrow")
+    for i, field in enumerate(table.schema):
+        if columns is not None and field.name not in columns:
+            continue
+        if not is_string_type(field.type):
+            continue
 
-    for col in df.columns:
-        s = df[col]
-        if not (pd.api.types.is_string_dtype(s) or pd.api.types.is_object_dtype(s)):
+        col = table.column(i)
+
+        # 0) One cheap pass over first characters rules out branches that can't reach 98%,
+        #    so free text (body) never pays for the regex or lowercase passes
+        first = pc.utf8_slice_codeunits(col, 0, 1)
+        maybe_number = _fraction(_starts_in(first, NUMBER_STARTS)) > 0.98
+        maybe_bool = not maybe_number and _fraction(_starts_in(first, BOOL_STARTS)) > 0.98
+        if not (maybe_number or maybe_bool):
             continue
 
-        s_str = s.astype("string[pyarrow]")
+        if maybe_number:
+            # 1) Integer-like? (no dots/exponent)
+            int_mask = pc.match_substring_regex(col, INT_PATTERN)
+            if _fraction(int_mask) > 0.98:
+                try:
+                    # First try signed 64-bit
+                    table = table.set_column(i, field.name, pc.cast(col, pa.int64()))
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    # If overflowed, try unsigned only if no negatives are present
+                    has_negative = pc.any(pc.starts_with(col, "-")).as_py()
+                    if not has_negative:
+                        try:
+                            unsigned = pc.cast(pc.utf8_ltrim(col, "+"), pa.uint64())
+                            table = table.set_column(i, field.name, unsigned)
+                        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                            pass  # keep exact as string
+                continue
 
-        # 1) Integer-like? (no dots/exponent)
-        int_mask = s_str.str.match(r'^[+-]?\d+$')
-        frac_int = float(int_mask.mean()) if len(s_str) else 0.0
-        if frac_int > 0.98:
-            try:
-                # First try signed 64-bit
-                df[col] = s_str.astype("Int64[pyarrow]")
-            except Exception:
-                # If overflowed, try unsigned only if no negatives are present
+            # 2) Float-like (decimals, exponents, or mixed)
+            num_mask = pc.match_substring_regex(col, FLOAT_PATTERN, ignore_case=True)
+            if _all(num_mask):
                 try:
-                    has_negative = bool(s_str[int_mask].str.contains('-', regex=False).any())
-                except Exception:
-                    has_negative = True
-                if not has_negative:
-                    try:
-                        df[col] = s_str.astype("UInt64[pyarrow]")
-                    except Exception:
-                        df[col] = s_str  # keep exact as string
-                else:
-                    df[col] = s_str
+                    num = pc.cast(col, pa.float64())
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    continue  # a spelling the regex takes but Arrow's parser doesn't; keep as string
+                table = _set_lossless(table, i, field.name, col, num)
             continue
 
-        # 2) Float-like (decimals, exponents, or mixed)
-        num = pd.to_numeric(s_str, errors="coerce")
-        if num.notna().mean() > 0.98:
-            df[col] = num.astype("Float64[pyarrow]")
+        # 3) Boolean-like
+        low = pc.utf8_lower(col)
+        bool_mask = pc.is_in(low, value_set=pa.array(["true", "false"]))
+        if _all(bool_mask):
+            table = _set_lossless(table, i, field.name, col, pc.equal(low, "true"))
+
+    return table
+
+
+def is_string_type(t: pa.DataType) -> bool:
+    return pa.types.is_string(t) or pa.types.is_large_string(t)
+
+
+def choose_dictionary_columns(table: pa.Table, sample_size: int, threshold: float,
+                              exclude) -> list:
+    cols = []
+    for field in table.schema:
+        if field.name in exclude:
+            continue
+        if not (is_string_type(field.type) or pa.types.is_integer(field.type)):
+            cols.append(field.name)  # other columns keep PyArrow's default (dictionary on)
             continue
+        sample = table.column(field.name).slice(0, sample_size)
+        n = len(sample) - sample.null_count
+        if n == 0 or pc.count_distinct(sample).as_py() / n < threshold:
+            cols.append(field.name)
+    return cols
 
-        # 3) Boolean-like
-        low = s_str.str.lower()
-        if low.isin(["true", "false"]).mean() > 0.98:
-            df[col] = low.map({"true": True, "false": False}).astype("boolean[pyarrow]")
 
-    return df
+def choose_column_encoding(table: pa.Table, dict_cols, sample_size: int) -> dict:
+    # Only columns without a dictionary may carry an explicit encoding
+    encoding = {}
+    for field in table.schema:
+        if field.name in dict_cols:
+            continue
+        if pa.types.is_integer(field.type):
+            encoding[field.name] = "DELTA_BINARY_PACKED"
+        elif is_string_type(field.type):
+            sample = table.column(field.name).slice(0, sample_size)
+            avg_len = pc.mean(pc.utf8_length(sample)).as_py() or 0.0
+            encoding[field.name] = "DELTA_BYTE_ARRAY" if avg_len <= 32 else "DELTA_LENGTH_BYTE_ARRAY"
+    return encoding
 
 
-def ensure_columns(df: pd.DataFrame, schema: pa.Schema) -> pd.DataFrame:
-    for name in schema.names:
-        if name not in df.columns:
-            df[name] = pd.NA
-    return df[schema.names]
+def parse_column_encoding(spec: str) -> dict:
+    encoding = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, enc = item.split("=", 1)
+            encoding[name.strip()] = enc.strip().upper()
+    return encoding
 
 
-# ---------- Main ----------
+LEVEL_RANGES = {"zstd": (1, 22), "gzip": (1, 9), "brotli": (0, 11)}
 
-def main():
-    args = parse_args()
 
+def codec_level(codec, level: int):
+    # snappy/none reject any level; the others reject out-of-range ones (gzip has no 22)
+    if codec not in LEVEL_RANGES:
+        return None
+    lo, hi = LEVEL_RANGES[codec]
+    return min(max(level, lo), hi)
+
+
+def open_writer(path: Path, schema: pa.Schema, codec, level: int, use_dict,
+                page_index: bool, page_size: int, column_encoding=None,
+                dict_page_size=None, page_version="1.0") -> pq.ParquetWriter:
+    opts = dict(
+        schema=schema,
+        compression=codec,
+        compression_level=codec_level(codec, level),
+        use_dictionary=use_dict,
+        write_statistics=True,
+        write_page_index=page_index,
+        data_page_size=page_size,
+        dictionary_pagesize_limit=dict_page_size,
+        data_page_version=page_version,
+        column_encoding=column_encoding or None,
+    )
+    # Older PyArrow raises TypeError on knobs it doesn't know; drop them newest first
+    optional = ["write_page_index", "dictionary_pagesize_limit", "column_encoding",
+                "data_page_version", "data_page_size", "compression_level"]
+    while True:
+        try:
+            return pq.ParquetWriter(str(path), **opts)
+        except TypeError:
+            if not optional:
+                raise
+            opts.pop(optional.pop(0))
+
+
+def shard_path(out_path: Path, tag: str) -> Path:
+    return out_path.with_name(f"{out_path.stem}-{tag}{out_path.suffix}")
+
+
+def split_row_groups(tables, rg_rows: int, final: bool = False):
+    # Cut buffered chunks into full row groups (zero-copy slices); the tail stays buffered
+    table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+    groups = []
+    start = 0
+    while table.num_rows - start >= rg_rows:
+        groups.append(table.slice(start, rg_rows))
+        start += rg_rows
+    rest = table.slice(start)
+    if final and rest.num_rows:
+        return groups + [rest], []
+    return groups, ([rest] if rest.num_rows else [])
+
+
+def row_group_rows(table: pa.Table, args):
+    if args.row_group_size is not None:
+        return args.row_group_size if args.row_group_size > 0 else None
+    # Row groups are about bytes: 1M rows of wide text can be several GB per group
+    bytes_per_row = max(1, table.nbytes // max(1, table.num_rows))
+    return max(1, args.row_group_bytes // bytes_per_row)
+
+
+def write_table(writer: pq.ParquetWriter, table: pa.Table, rg_size):
+    try:
+        writer.write_table(table, row_group_size=rg_size)
+    except TypeError:
+        # older pyarrow: split manually if needed
+        if rg_size and rg_size > 0 and table.num_rows > rg_size:
+            for start in range(0, table.num_rows, rg_size):
+                writer.write_table(table.slice(start, rg_size))
+        else:
+            writer.write_table(table)
+
+
+def as_text(col):
+    try:
+        return pc.cast(col, pa.string())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # Nested values have no string cast; keep them as JSON text
+        return pa.array([None if v is None else json.dumps(v, default=str) for v in col.to_pylist()],
+                        pa.string())
+
+
+def cast_drifted(col, field: pa.Field):
+    """
+    Cast a chunk column whose type differs from the writer schema's (a declared type, or drift
+    after the first chunk such as a bool column that later holds epoch floats). The writer schema
+    can't change mid-file, so a value that would be written as null or as another value raises.
+    """
+    t = field.type
+    if is_string_type(t):
+        return as_text(col).cast(t)
+    out = None
+    if pa.types.is_boolean(t) and not pa.types.is_boolean(col.type):
+        # Arrow casts any non-zero number to true; only 0/1 and 'true'/'false' are booleans here
+        low = pc.utf8_lower(as_text(col))
+        ok = pc.is_in(low, value_set=pa.array(["true", "false", "1", "0"]))
+        out = pc.if_else(ok, pc.is_in(low, value_set=pa.array(["true", "1"])), None)
+    else:
+        try:
+            out = col.cast(t)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    if out is None or out.null_count > col.null_count:
+        raise ValueError(f"column {field.name!r} holds {col.type} values that do not fit {t}, the type "
+                         f"chosen from the first chunk; declare it with --schema-json")
+    return out
+
+
+def ensure_columns(table: pa.Table, schema: pa.Schema, layouts: dict) -> pa.Table:
+    # Common case: chunk already matches the writer schema, nothing to rebuild
+    if table.schema.equals(schema):
+        return table
+    # Map writer columns to chunk column indices once per distinct chunk layout
+    names = tuple(table.column_names)
+    indices = layouts.get(names)
+    if indices is None:
+        pos = {name: i for i, name in enumerate(names)}
+        indices = layouts[names] = [pos.get(name) for name in schema.names]
+    columns = []
+    for field, i in zip(schema, indices):
+        if i is None:
+            columns.append(pa.nulls(table.num_rows, field.type))
+            continue
+        col = table.column(i)
+        columns.append(col if col.type == field.type else cast_drifted(col, field))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+# ---------- Conversion ----------
+
+def iter_tables(path: Path, fmt: str, args):
+    if fmt == "csv":
+        chunks = iter_chunks_csv(
+            path, block_size=args.block_size, sep=args.csv_sep,
+            header=args.has_header, encoding=args.csv_encoding,
+            buffer_size=args.read_buffer_size, schema=args.schema, decoder=args.decoder,
+            columns=args.columns,
+        )
+    else:
+        chunks = iter_chunks_jsonl(path, block_size=args.block_size, buffer_size=args.read_buffer_size,
+                                   schema=args.schema, decoder=args.decoder, columns=args.columns)
+    try:
+        for table in chunks:
+            if table is None or table.num_rows == 0:
+                continue
+            yield table
+    finally:
+        chunks.close()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    # Blocking put that gives up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(items, depth: int):
+    """Iterate `items` on a background thread, staying up to `depth` results ahead."""
+    if depth <= 0:
+        yield from items
+        return
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if not _put(q, ("item", item), stop):
+                    return
+            _put(q, ("done", None), stop)
+        except BaseException as e:
+            _put(q, ("error", e), stop)
+        finally:
+            items.close()  # close from the thread that ran it (releases the bz2 handle)
+
+    t = threading.Thread(target=produce, name="bz2-decode", daemon=True)
+    t.start()
+    try:
+        while True:
+            kind, value = q.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+        t.join()
+
+
+def plan_writer(raw: pa.Table, args):
+    """Decide schema, coercion, dictionary and encoding once from the first chunk."""
+    table = raw
+    coerce_columns = []
+    if args.schema is not None:
+        # Declared types: cast instead of guessing
+        table = ensure_columns(raw, args.schema, {})
+    elif not args.no_coerce:
+        table = coerce_chunk(raw)
+        # Only columns coerced here can change type later; the writer schema keeps the rest
+        # as string, so re-checking them per chunk is wasted work (and a later int cast would
+        # be cast back to string, e.g. "007" -> "7")
+        coerce_columns = [
+            f.name for f in raw.schema
+            if is_string_type(f.type) and not is_string_type(table.schema.field(f.name).type)
+        ]
+    schema = widen_null_types(table.schema)
+    table = table.cast(schema)
+    if args.save_schema_json:
+        save_schema_json(schema, args.save_schema_json)
+    use_dict = not args.no_dict
+    if use_dict:
+        no_dict_cols = {c.strip() for c in args.no_dict_columns.split(",") if c.strip()}
+        use_dict = choose_dictionary_columns(
+            table, args.dict_sample_size, args.dict_threshold, no_dict_cols
+        )
+    column_encoding = {}
+    if not args.no_column_encoding:
+        column_encoding = choose_column_encoding(table, set(use_dict or ()), args.dict_sample_size)
+    column_encoding.update(parse_column_encoding(args.column_encoding))
+    if use_dict:
+        use_dict = [c for c in use_dict if c not in column_encoding]
+    plan = {
+        "schema": schema,
+        "row_group_size": row_group_rows(table, args),
+        "coerce_columns": set(coerce_columns),
+        "use_dict": use_dict,
+        "column_encoding": column_encoding,
+    }
+    return plan, table
+
+
+def peek_plan(files, fmt: str, args):
+    for f in files:
+        tables = iter_tables(f, fmt, args)
+        try:
+            for table in tables:
+                return plan_writer(table, args)[0]
+        finally:
+            tables.close()
+    return None
+
+
+def output_paths(base: Path, n_writers: int):
+    if n_writers == 1:
+        return [base]
+    return [shard_path(base, f"part{i:03d}") for i in range(n_writers)]
+
+
+def write_files(files, fmt: str, args, out_paths, plan=None):
+    """Stream every chunk of `files` into `out_paths`; returns (files_done, total_rows)."""
+    codec = None if args.parquet_compression == "none" else args.parquet_compression
+    n_writers = len(out_paths)
+
+    writers = []
+    layouts = {}
+    total_rows = 0
+    files_done = 0
+    n_tables = 0
+    buffered = []  # conformed chunks not yet filling a whole row group
+    buffered_rows = 0
+    failed = False
+
+    # Arrow releases the GIL while encoding/compressing, so writer threads compress in parallel.
+    # At most one table in flight per writer keeps memory bounded and rows ordered within a part.
+    pool = ThreadPoolExecutor(max_workers=n_writers) if n_writers > 1 else None
+    pending = [None] * n_writers
+
+    def dispatch(table: pa.Table):
+        nonlocal n_tables
+        if pool is None:
+            write_table(writers[0], table, plan["row_group_size"])
+        else:
+            w = n_tables % n_writers
+            if pending[w] is not None:
+                pending[w].result()  # re-raises a failed write
+            pending[w] = pool.submit(write_table, writers[w], table, plan["row_group_size"])
+        n_tables += 1
+
+    try:
+        for f in files:
+            file_rows = 0
+            for table in prefetch(iter_tables(f, fmt, args), args.pipeline_depth):
+                if plan is None:
+                    plan, table = plan_writer(table, args)
+                elif plan["coerce_columns"]:
+                    table = coerce_chunk(table, plan["coerce_columns"])
+                if not writers:
+                    writers = [
+                        open_writer(
+                            path, plan["schema"], codec, args.compression_level, plan["use_dict"],
+                            page_index=not args.no_page_index, page_size=args.data_page_size,
+                            column_encoding=plan["column_encoding"],
+                            dict_page_size=args.dictionary_page_size,
+                            page_version=args.data_page_version,
+                        )
+                        for path in out_paths
+                    ]
+                try:
+                    table = ensure_columns(table, plan["schema"], layouts)
+                except ValueError as e:
+                    raise ValueError(f"{f.name}: {e}") from None
+
+                r = table.num_rows
+                file_rows += r
+                total_rows += r
+
+                # write_table never merges calls, so buffer chunks into whole row groups
+                rg_rows = plan["row_group_size"]
+                if not rg_rows:
+                    dispatch(table)
+                    continue
+                buffered.append(table)
+                buffered_rows += r
+                if buffered_rows >= rg_rows:
+                    groups, buffered = split_row_groups(buffered, rg_rows)
+                    buffered_rows = sum(t.num_rows for t in buffered)
+                    for group in groups:
+                        dispatch(group)
+
+            fadvise(f, "POSIX_FADV_DONTNEED")  # read once; free its cached pages for the next file
+            if file_rows > 0:
+                files_done += 1
+                print(f"✔ Wrote {file_rows:,} rows from {f.name}")
+            else:
+                print(f"– Skipped empty or unreadable: {f.name}")
+
+        if buffered:
+            for group in split_row_groups(buffered, plan["row_group_size"], final=True)[0]:
+                dispatch(group)
+
+        for fut in pending:
+            if fut is not None:
+                fut.result()
+
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        if pool is not None:
+            wait([fut for fut in pending if fut is not None])
+            pool.shutdown()
+        for writer in writers:
+            writer.close()
+        for path in out_paths:
+            if failed:
+                # A half-written output would pass for a complete one; leave nothing behind
+                Path(path).unlink(missing_ok=True)
+                continue
+            # Only pages already written back are dropped; the rest go once the kernel flushes them
+            if Path(path).exists():
+                fadvise(path, "POSIX_FADV_DONTNEED")
+
+    return files_done, total_rows
+
+
+def set_thread_hint(threads: int):
     # Optional thread hint (ignored by older PyArrow)
     try:
-        if args.threads and args.threads > 0:
-            pa.set_cpu_count(args.threads)
+        if threads and threads > 0:
+            pa.set_cpu_count(threads)
     except Exception:
         pass
 
+
+CONTENT_SUFFIXES = (".jsonl", ".ndjson", ".json", ".csv", ".tsv")
+
+
+def shard_outputs(f: Path, args):
+    # OUT-<file>.parquet, with only .bz2 and a known content suffix stripped: a plain
+    # Path.stem twice would map comments.2015.01.bz2 and comments.2015.02.bz2 to one shard
+    tag = f.stem
+    if tag.lower().endswith(CONTENT_SUFFIXES):
+        tag = tag[:tag.rindex(".")]
+    base = shard_path(Path(args.output_parquet), tag)
+    return output_paths(base, max(1, args.zstd_workers))
+
+
+def convert_shard(f: Path, fmt: str, args, plan: dict):
+    # Pool worker: one bz2 file -> its own shard(s)
+    set_thread_hint(args.threads)
+    return write_files([f], fmt, args, shard_outputs(f, args), plan)
+
+
+# ---------- Main ----------
+
+def main():
+    args = parse_args()
+    set_thread_hint(args.threads)
+    args.schema = load_schema_json(args.schema_json) if args.schema_json else None
+    args.decoder = resolve_decoder(args.decoder)
+    args.columns = [c.strip() for c in args.columns.split(",") if c.strip()] or None
+    if args.columns and args.schema is not None:
+        # Projection of a declared schema: keep its types, take the requested order
+        declared = {f.name: f for f in args.schema}
+        args.schema = pa.schema([declared.get(c, pa.field(c, pa.string())) for c in args.columns])
+
     in_dir = Path(args.input_dir)
     if not in_dir.exists() or not in_dir.is_dir():
         print(f"Input is not a directory: {in_dir}", file=sys.stderr)
@@ -226,96 +1161,60 @@ def main():
     out_path = Path(args.output_parquet)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    codec = None if args.parquet_compression == "none" else args.parquet_compression
-    use_dict = not args.no_dict
-    do_coerce = not args.no_coerce
-    rg_size = int(args.row_group_size) if args.row_group_size and args.row_group_size > 0 else None
+    if args.auto_level:
+        if args.parquet_compression == "zstd":
+            args.compression_level = probe_zstd_level(
+                files[0], args.auto_level_sample, args.read_buffer_size, args.auto_level_tolerance,
+                args.decoder,
+            )
+        else:
+            print("--auto-level only applies to zstd; ignoring.", file=sys.stderr)
 
-    writer = None
-    schema = None
-    total_rows = 0
-    files_done = 0
-
-    try:
-        for f in files:
-            if fmt == "csv":
-                chunks = iter_chunks_csv(
-                    f, chunksize=args.chunksize, sep=args.csv_sep,
-                    header=args.has_header, encoding=args.csv_encoding
-                )
-            else:
-                chunks = iter_chunks_jsonl(f, chunksize=args.chunksize)
+    n_writers = max(1, args.zstd_workers)
+    jobs = args.jobs if args.jobs > 0 else max(1, (os.cpu_count() or 2) - 1)
+    jobs = min(jobs, len(files))  # one file per worker at most
 
-            file_rows = 0
-            for chunk in chunks:
-                if chunk is None or chunk.empty:
-                    continue
-                if do_coerce:
-                    chunk = coerce_chunk(chunk)
-
-                if schema is None:
-                    table = pa.Table.from_pandas(chunk, preserve_index=False)
-                    schema = table.schema
-                    # Create writer (compression level may not be supported on old PyArrow)
-                    try:
-                        writer = pq.ParquetWriter(
-                            str(out_path),
-                            schema=schema,
-                            compression=codec,
-                            compression_level=args.compression_level,
-                            use_dictionary=use_dict,
-                            write_statistics=True,
-                        )
-                    except TypeError:
-                        writer = pq.ParquetWriter(
-                            str(out_path),
-                            schema=schema,
-                            compression=codec,
-                            use_dictionary=use_dict,
-                            write_statistics=True,
-                        )
-                    # write first chunk
+    failed = 0
+    if jobs == 1:
+        files_done, total_rows = write_files(files, fmt, args, output_paths(out_path, n_writers))
+        output = out_path if n_writers == 1 else shard_path(out_path, "part*")
+    else:
+        # bz2 decode is single-threaded per stream, so decode files in parallel, one shard each.
+        # The plan comes from the first chunk so every shard shares one schema.
+        plan = peek_plan(files, fmt, args)
+        files_done, total_rows = 0, 0
+        if args.threads <= 0:
+            # Split the cores between workers instead of letting each one claim all of them
+            args.threads = max(1, (os.cpu_count() or 1) // jobs)
+        if plan is not None:
+            print(f"→ Converting {len(files)} file(s) | jobs={jobs} | threads/job={args.threads}")
+            with ProcessPoolExecutor(max_workers=jobs) as ex:
+                futures = {ex.submit(convert_shard, f, fmt, args, plan): f for f in files}
+                for fut in as_completed(futures):
                     try:
-                        writer.write_table(table, row_group_size=rg_size)
-                    except TypeError:
-                        # older pyarrow: split manually if needed
-                        if rg_size and rg_size > 0 and table.num_rows > rg_size:
-                            for start in range(0, table.num_rows, rg_size):
-                                writer.write_table(table.slice(start, rg_size))
-                        else:
-                            writer.write_table(table)
-                else:
-                    chunk = ensure_columns(chunk, schema)
-                    table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
-                    try:
-                        writer.write_table(table, row_group_size=rg_size)
-                    except TypeError:
-                        if rg_size and rg_size > 0 and table.num_rows > rg_size:
-                            for start in range(0, table.num_rows, rg_size):
-                                writer.write_table(table.slice(start, rg_size))
-                        else:
-                            writer.write_table(table)
-
-                r = len(chunk)
-                file_rows += r
-                total_rows += r
-
-            if file_rows > 0:
-                files_done += 1
-                print(f"✔ Wrote {file_rows:,} rows from {f.name}")
-            else:
-                print(f"– Skipped empty or unreadable: {f.name}")
+                        done, rows = fut.result()
+                    except Exception as e:
+                        print(f"✖ Failed: {futures[fut].name}  |  Reason: {e}", file=sys.stderr)
+                        failed += 1
+                        # write_files removes its outputs on error, but not when the worker died
+                        for path in shard_outputs(futures[fut], args):
+                            path.unlink(missing_ok=True)
+                        continue
+                    files_done += done
+                    total_rows += rows
+        output = shard_path(out_path, "*")
 
-        if writer is None:
-            print("All files were empty; nothing to write.", file=sys.stderr)
-            sys.exit(2)
+    if failed:
+        print(f"\n✖ {failed} file(s) failed; their shards were removed. "
+              f"Files processed: {files_done}/{len(files)} | Total rows: {total_rows:,}", file=sys.stderr)
+        sys.exit(1)
 
-    finally:
-        if writer is not None:
-            writer.close()
+    if total_rows == 0:
+        print("All files were empty; nothing to write.", file=sys.stderr)
+        sys.exit(2)
 
     print(f"\nDone. Files processed: {files_done}/{len(files)} | "
-          f"Total rows: {total_rows:,} | Output: {out_path}")
+          f"Total rows: {total_rows:,} | Output: {output}")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,39 @@
 """
 DuckDB (Python) CSV -> Parquet batch converter
 
-- Recursively walks an input directory for *.csv
+- Recursively walks an input directory for *.csv (and *.csv.bz2)
+- *.csv.bz2 is decompressed on a thread into a named pipe (mkfifo) that read_csv scans directly, so no
+  decompressed copy ever touches the disk (DuckDB has no bz2 reader of its own). POSIX only.
+  Copied in 4 MiB unbuffered writes (--read-buffer-size) into a pipe widened from 64 KiB to 1 MiB on Linux.
+  With lbzip2/pbzip2 on PATH (--decoder), the tool writes into the pipe itself: multithreaded, no Python loop
 - Writes Parquet files to a mirrored path under the output directory
-- Uses DuckDB's COPY with ZSTD compression (level configurable)
-- Safe on 16 GB RAM; DuckDB streams CSV -> Parquet
+- Page-cache hints where posix_fadvise exists: SEQUENTIAL on bz2 input, DONTNEED on each input and
+  output once converted, so a multi-TB pass doesn't evict everything else
+- Uses DuckDB's COPY with ZSTD compression (level configurable), fed straight from the parallel read_csv scanner
+- Safe on 16 GB RAM; DuckDB streams CSV -> Parquet. The default memory_limit is 8GB in total, split across
+  --jobs connections; an explicit --memory-limit applies to each job
 - Used caffeinate so the Mac doesn’t sleep.
-- Compression range: 1 to 22. Max is 22 and takes long. Typically 9 is balanced with ~4–6× faster writes with only a small size penalty (a few % to ~10%).
+- --sniff-once detects the CSV dialect/types from the first file only and passes them to every read_csv
+  (columns={...}, auto_detect=FALSE), instead of re-sniffing each of thousands of same-shaped files
+- --merge-to FILE writes everything into one Parquet through a single read_csv([...all files...]) scan,
+  so one parallel scanner steals work across files rather than one COPY per file. Each .csv.bz2 gets a FIFO,
+  but its decoder only starts when DuckDB opens the file, so at most --threads decoders run at once (each
+  with cpu_count // that many threads). Add --per-thread-output
+  to make FILE a directory that every DuckDB thread writes its own part into (no single-writer funnel)
+- Compression range: 1 to 22. Max is 22 and takes long. Default is 9, which is balanced with ~4–6× faster writes than 22 with only a small size penalty (a few % to ~10%).
+- ZSTD level tiers: 1–5 realtime, 10–15 balanced, 19–22 archival. 22 is still available via --level but is never the default.
 - PRAGMA threads=4 avoids thermal throttling; raise to 6–8 if you want to push harder.
+  --threads 0 = auto: DuckDB's own default (all cores) for one connection, cpu_count // jobs with --jobs N.
+- Files are converted in parallel (--jobs), each in its own process and DuckDB connection with --threads threads.
+  Default jobs is cpu_count // threads so the machine is busy without oversubscribing.
+- DuckDB's progress bar is shown when a single COPY runs (--jobs 1 or --merge-to) and hidden when parallel
+  workers would interleave their bars
 - DuckDB streams CSV → Parquet; typical memory is sub-GB to a few GB, depending on columns.
+- preserve_insertion_order=false plus an explicit row group budget and memory_limit keep DuckDB off its
+  slow, memory-hungry Parquet write path on 10 GB+ CSVs.
+- Row groups are sized in bytes (ROW_GROUP_SIZE_BYTES, default 128MB) rather than rows: Reddit rows range
+  from ~100 B to several KB, so a fixed row count gives anything from tiny to multi-GB groups.
+  --row-group-size N still forces N rows per group
 - DuckDB & PyArrow stream data in chunks; they don’t need to load a 90 GB CSV into RAM. With sensible settings, memory stays well under a few GB.
 - 90GB compression at level 22 can take upto 10 hours.
 
@@ -19,92 +44,440 @@ Usage examples:
   python3 duckdb_csv_to_parquet.py \
     --in-dir "/Volumes/alienHD/csv_output" \
     --out-dir "/Volumes/alienHD/parquet_output" \
-    --compression zstd --level 22 --threads 4
+    --compression zstd --level 9 --threads 4 --jobs 2
 
-  # Faster writes, nearly same size:
-  python3 duckdb_csv_to_parquet.py --level 9
+  # Archival (smallest files, can take ~10 hours for 90GB):
+  python3 duckdb_csv_to_parquet.py --level 22
 """
 
+import bz2
 import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
 import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
 import duckdb
 
+try:
+    import fcntl  # POSIX only; used to widen the bz2 pipe
+except ImportError:
+    fcntl = None
+
+DEFAULT_MEMORY_MB = 8192  # --memory-limit default, shared by all jobs
+PIPE_SIZE = 1 << 20  # Linux default 64 KiB; 1 MiB is the usual unprivileged max (fs.pipe-max-size)
+
 def sql_quote(path: str) -> str:
-    # Minimal SQL string literal escaping for file paths
+    # Minimal SQL string literal escaping, for PRAGMA values that can't take parameters
     return path.replace("'", "''")
 
+def widen_pipe(fd: int):
+    # Fewer writer/reader context switches per MiB; not available off Linux
+    try:
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+    except (AttributeError, OSError):
+        pass
+
+DECODER_TOOLS = ("lbzip2", "pbzip2")
+
+def fadvise(target, advice: str):
+    # Page-cache hint on an fd or a path; a no-op where posix_fadvise is missing (macOS, Windows)
+    flag = getattr(os, advice, None)
+    if flag is None or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        if isinstance(target, int):
+            os.posix_fadvise(target, 0, 0, flag)
+            return
+        fd = os.open(target, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, flag)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def decoder_command(name: str, threads: int):
+    # External decoder argv (file appended later), or None for Python's bz2
+    if name == "auto":
+        name = next((t for t in DECODER_TOOLS if shutil.which(t)), "python")
+    if name == "python":
+        return None
+    if not shutil.which(name):
+        raise SystemExit(f"--decoder {name}: not found on PATH")
+    return [name, "-dc", "-n", str(threads)] if name == "lbzip2" else [name, "-dc", f"-p{threads}"]
+
+def open_fifo_writer(fifo: Path, cancel: threading.Event):
+    # Write end of the pipe; open() blocks until DuckDB opens it for reading, or until
+    # release_fifo wakes it on exit (then cancel is set and nothing is written)
+    fout = open(fifo, "wb", buffering=0)
+    if cancel.is_set():
+        fout.close()
+        return None
+    return fout
+
+def release_fifo(fifo: Path):
+    # Wake a writer waiting in open() by briefly being its reader
+    try:
+        os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+    except OSError:
+        pass
+
+def feed_fifo(src: Path, fifo: Path, buffer_size: int, errors: list, cancel: threading.Event,
+              decoder=None):
+    # Writer side of the pipe; the decoder only starts once DuckDB opens it for reading.
+    # Unbuffered: each buffer_size chunk goes to the pipe in one write, no extra copy
+    try:
+        fout = open_fifo_writer(fifo, cancel)
+        if fout is None:
+            return
+        with fout:
+            widen_pipe(fout.fileno())
+            if decoder:
+                code = subprocess.run([*decoder, str(src)], stdout=fout).returncode
+                # SIGPIPE just means the reader went away, like BrokenPipeError below
+                if code not in (0, -signal.SIGPIPE):
+                    raise OSError(f"{decoder[0]} exited with status {code} on {src}")
+                return
+            with bz2.BZ2File(src, "rb") as fin:
+                fadvise(fin.fileno(), "POSIX_FADV_SEQUENTIAL")
+                shutil.copyfileobj(fin, fout, buffer_size)
+    except BrokenPipeError:
+        pass  # reader went away; its own error is the one to report
+    except Exception as e:
+        errors.append(e)
+
+@contextmanager
+def csv_source(src: Path, temp_directory, buffer_size: int, decoder=None):
+    # Plain CSV is read in place; .csv.bz2 is decoded into a FIFO that DuckDB reads like a file
+    if src.suffix.lower() != ".bz2":
+        yield src
+        return
+    if temp_directory:
+        # Same spelling as open_conn's PRAGMA: ~ expanded, created on first use
+        temp_directory = Path(temp_directory).expanduser().resolve()
+        temp_directory.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix="bz2fifo-", dir=temp_directory))
+    fifo = tmp / (src.stem or "input")  # keeps the .csv name for DuckDB
+    os.mkfifo(fifo)
+    errors = []
+    cancel = threading.Event()
+    feeder = threading.Thread(target=feed_fifo, args=(src, fifo, buffer_size, errors, cancel, decoder),
+                              daemon=True)
+    feeder.start()
+    try:
+        yield fifo
+    finally:
+        # The feeder may not have reached open() yet when the query failed early, so one wake-up
+        # can come too soon: repeat until it is gone. One mid-copy ends on EPIPE as DuckDB closes
+        cancel.set()
+        while feeder.is_alive():
+            release_fifo(fifo)
+            feeder.join(0.05)
+        shutil.rmtree(tmp, ignore_errors=True)
+    if errors:
+        # A bz2 error ends the stream early, which DuckDB reads as a clean EOF
+        raise errors[0]
+
+def sniff_read_options(conn: duckdb.DuckDBPyConnection, src: Path, sample_size: int) -> dict:
+    # Dialect + column types from one file, as explicit read_csv options (auto_detect off)
+    row = conn.execute(
+        "SELECT Delimiter, Quote, Escape, HasHeader, Skiprows, Columns, DateFormat, TimestampFormat "
+        "FROM sniff_csv($src, sample_size=$sample_size)",
+        {"src": str(src), "sample_size": sample_size},
+    ).fetchone()
+    delim, quote, escape, header, skip, columns, date_fmt, ts_fmt = row
+    blank = lambda v: "" if v == "(empty)" else v
+    opts = {"auto_detect": False, "delim": delim, "quote": blank(quote), "escape": blank(escape),
+            "header": header, "skip": skip, "columns": {c["name"]: c["type"] for c in columns}}
+    if date_fmt:
+        opts["dateformat"] = date_fmt
+    if ts_fmt:
+        opts["timestampformat"] = ts_fmt
+    return opts
+
 def convert_one(conn: duckdb.DuckDBPyConnection, src: Path, dst: Path,
-                compression: str, level: int, ignore_errors: bool):
+                compression: str, level: int, ignore_errors: bool, sample_size: int,
+                row_group_opts: str, read_opts=None, per_thread: bool = False):
     dst.parent.mkdir(parents=True, exist_ok=True)
 
-    src_q = sql_quote(str(src))
-    dst_q = sql_quote(str(dst))
+    # Paths and read_csv options are bound as $parameters, never spliced into the SQL text,
+    # so quotes/backslashes/unicode in file names can't break the statement.
+    # A list of files becomes one read_csv([...]) scan
+    params = {"src": [str(p) for p in src] if isinstance(src, list) else str(src), "dst": str(dst)}
+
+    # read_csv options we commonly toggle; a sniffed schema replaces per-file auto-detection
+    read = dict(read_opts or {"auto_detect": True, "sample_size": sample_size})
+    read.update(parallel=True, ignore_errors=ignore_errors)
+    params.update(read)
+    read_sql = ", ".join(f"{name}=${name}" for name in read)
 
-    # read_csv_auto options we commonly toggle
-    ignore = "TRUE" if ignore_errors else "FALSE"
+    # COMPRESSION_LEVEL only applies to ZSTD; other codecs reject it
+    level_opt = f",\n      COMPRESSION_LEVEL {level}" if compression == "zstd" else ""
+    # dst is a directory of data_<n>.parquet, one written by each DuckDB thread
+    if per_thread:
+        level_opt += ",\n      PER_THREAD_OUTPUT TRUE, OVERWRITE TRUE"
 
+    # Bare FROM (no SELECT * projection) lets DuckDB fuse the parallel CSV scan with the Parquet write
     sql = f"""
     COPY (
-      SELECT * FROM read_csv_auto('{src_q}', ignore_errors={ignore})
+      FROM read_csv($src, {read_sql})
     )
-    TO '{dst_q}' (
+    TO $dst (
       FORMAT PARQUET,
-      COMPRESSION {compression.upper()},
-      COMPRESSION_LEVEL {level}
+      COMPRESSION {compression.upper()}{level_opt},
+      {row_group_opts}
     );
     """
-    conn.execute(sql)
+    conn.execute(sql, params)
+
+MAX_ROW_GROUP_ROWS = 5_000_000  # ceiling so the byte budget, not DuckDB's 122,880-row default, decides
+
+def row_group_options(rows, nbytes) -> str:
+    # A fixed row count wins; otherwise let DuckDB close each row group at a byte budget
+    if rows:
+        return f"ROW_GROUP_SIZE {rows}"
+    if nbytes:
+        return f"ROW_GROUP_SIZE_BYTES '{sql_quote(nbytes)}', ROW_GROUP_SIZE {MAX_ROW_GROUP_ROWS}"
+    return "ROW_GROUP_SIZE 100000"
+
+def open_conn(threads: int, memory_limit, temp_directory, progress: bool = False) -> duckdb.DuckDBPyConnection:
+    # In-memory DuckDB connection (no DB file needed)
+    conn = duckdb.connect(database=':memory:')
+    if threads > 0:  # 0 keeps DuckDB's default of every core; PRAGMA threads=0 would not mean auto
+        conn.execute(f"PRAGMA threads={threads};")
+    conn.execute(f"PRAGMA {'enable' if progress else 'disable'}_progress_bar;")
+    # Row order within a file doesn't matter here; keeping it forces DuckDB to buffer and
+    # serialize the Parquet write, which is the slow path on multi-GB CSVs
+    conn.execute("PRAGMA preserve_insertion_order=false;")
+    if memory_limit:
+        conn.execute(f"PRAGMA memory_limit='{sql_quote(memory_limit)}';")
+    if temp_directory:
+        td = sql_quote(str(Path(temp_directory).expanduser().resolve()))
+        conn.execute(f"PRAGMA temp_directory='{td}';")
+    return conn
+
+def convert_worker(src: Path, dst: Path, compression: str, level: int,
+                   ignore_errors: bool, sample_size: int, row_group_opts: str,
+                   threads: int, memory_limit, temp_directory, read_buffer_size: int,
+                   read_opts=None, decoder=None, progress: bool = False):
+    # Runs in a pool process: each worker owns its connection, one COPY per file
+    conn = open_conn(threads, memory_limit, temp_directory, progress)
+    try:
+        t0 = time.time()
+        try:
+            with csv_source(src, temp_directory, read_buffer_size, decoder) as path:
+                convert_one(conn, path, dst, compression, level, ignore_errors, sample_size,
+                            row_group_opts, read_opts)
+        except BaseException:
+            dst.unlink(missing_ok=True)  # never leave a truncated Parquet behind
+            raise
+        # Read once / written once: drop both from the page cache (dirty pages stay until written back)
+        fadvise(src, "POSIX_FADV_DONTNEED")
+        fadvise(dst, "POSIX_FADV_DONTNEED")
+        return time.time() - t0
+    finally:
+        conn.close()
+
+def merge_worker(srcs, dst: Path, compression: str, level: int, ignore_errors: bool,
+                 sample_size: int, row_group_opts: str, threads: int, memory_limit,
+                 temp_directory, read_buffer_size: int, per_thread: bool = False, decoder=None):
+    # All files in one read_csv list: a single parallel scan with file-level work stealing.
+    # Schema comes from the first file (union_by_name off), like --sniff-once
+    conn = open_conn(threads, memory_limit, temp_directory, progress=True)
+    try:
+        t0 = time.time()
+        # A multi-file auto-detect reopens every file, and a .csv.bz2 FIFO can only be read once
+        # (the scan would block on a pipe nobody feeds): sniff the first file on its own instead
+        with csv_source(srcs[0], temp_directory, read_buffer_size, decoder) as path:
+            read_opts = sniff_read_options(conn, path, sample_size)
+        with ExitStack() as stack:
+            paths = [stack.enter_context(csv_source(src, temp_directory, read_buffer_size, decoder))
+                     for src in srcs]
+            convert_one(conn, paths, dst, compression, level, ignore_errors, sample_size,
+                        row_group_opts, read_opts, per_thread=per_thread)
+        for src in srcs:
+            fadvise(src, "POSIX_FADV_DONTNEED")
+        for part in (dst.glob("*.parquet") if per_thread else [dst]):
+            fadvise(part, "POSIX_FADV_DONTNEED")
+        return time.time() - t0
+    except BaseException:
+        if not per_thread:
+            dst.unlink(missing_ok=True)
+        raise
+    finally:
+        conn.close()
+
+def list_sources(in_dir: Path, bz2_ok: bool):
+    # One walk of the tree, each name lower-cased and classified once; plain CSVs first
+    buckets = {".csv": [], ".csv.bz2": []}
+    for root, _, names in os.walk(in_dir):
+        for name in names:
+            n = name.lower()
+            kind = ".csv" if n.endswith(".csv") else ".csv.bz2" if n.endswith(".csv.bz2") else None
+            if kind:
+                buckets[kind].append(Path(root, name))
+    return sorted(buckets[".csv"]) + (sorted(buckets[".csv.bz2"]) if bz2_ok else [])
 
 def main():
     ap = argparse.ArgumentParser(description="Convert CSV files to Parquet using DuckDB (Python).")
-    ap.add_argument("--in-dir",  required=True, help="Input root directory containing CSV files")
-    ap.add_argument("--out-dir", required=True, help="Output root directory for Parquet files")
-    ap.add_argument("--threads", type=int, default=4, help="DuckDB PRAGMA threads (tune for your CPU/thermals)")
+    ap.add_argument("--in-dir",  required=True, help="Input root directory containing CSV (or .csv.bz2) files")
+    ap.add_argument("--out-dir", help="Output root directory for Parquet files (one per CSV)")
+    ap.add_argument("--merge-to", metavar="FILE",
+                    help="Write every CSV into this one Parquet file instead, via a single multi-file scan "
+                         "(files must share columns; give it more --threads)")
+    ap.add_argument("--per-thread-output", action="store_true",
+                    help="With --merge-to: treat FILE as a directory and let each DuckDB thread write its "
+                         "own data_<n>.parquet in parallel (read back as '<dir>/*.parquet')")
+    ap.add_argument("--threads", type=int, default=4,
+                    help="DuckDB PRAGMA threads per connection (tune for your CPU/thermals; "
+                         "0 = auto: all cores, or cpu_count // jobs with --jobs)")
+    ap.add_argument("--jobs", type=int, default=0,
+                    help="CSV files converted in parallel, one DuckDB connection each "
+                         "(default: cpu_count // threads; 1 with --threads 0)")
     ap.add_argument("--compression", default="zstd", choices=["zstd", "snappy", "gzip", "brotli", "lz4", "uncompressed"],
                     help="Parquet compression codec (DuckDB supports these)")
-    ap.add_argument("--level", type=int, default=22, help="Compression level (ZSTD supports 1–22)")
+    ap.add_argument("--level", type=int, default=9,
+                    help="ZSTD compression level 1–22 (default: 9). 1–5 realtime, 10–15 balanced, 19–22 archival")
     ap.add_argument("--overwrite", action="store_true", help="Overwrite existing .parquet files")
     ap.add_argument("--ignore-errors", action="store_true", help="Skip malformed CSV rows instead of failing")
+    ap.add_argument("--sample-size", type=int, default=20480,
+                    help="Rows sampled for CSV type detection (default: 20480, -1 = whole file; slower but safest)")
+    ap.add_argument("--sniff-once", action="store_true",
+                    help="Sniff dialect and column types from the first file only and read every file "
+                         "with them (auto_detect off). For many same-shaped CSVs; a file that doesn't "
+                         "fit the types fails (or loses rows with --ignore-errors)")
+    ap.add_argument("--row-group-bytes", default="128MB",
+                    help="Target row group size in bytes, e.g. 64MB or 1GB (default: 128MB; '' = 100,000 rows)")
+    ap.add_argument("--row-group-size", type=int, default=None,
+                    help="Fixed rows per Parquet row group instead of --row-group-bytes")
+    ap.add_argument("--memory-limit", default=None,
+                    help="DuckDB memory_limit per job, e.g. 4GB (default: 8GB in total, split across jobs; "
+                         "'' = DuckDB default)")
     ap.add_argument("--temp-directory", default=None, help="Optional temp dir for DuckDB spills (e.g., on the SSD)")
+    ap.add_argument("--read-buffer-size", type=int, default=4 << 20,
+                    help="Bytes per bz2 read/pipe write when streaming .csv.bz2 (default: 4 MiB)")
+    ap.add_argument("--decoder", choices=["auto", "python", *DECODER_TOOLS], default="auto",
+                    help="bz2 decoder for .csv.bz2: Python's bz2 or an lbzip2/pbzip2 subprocess running "
+                         "cpu_count // jobs threads (default: auto = lbzip2/pbzip2 if on PATH)")
     args = ap.parse_args()
+    if not args.out_dir and not args.merge_to:
+        ap.error("one of --out-dir or --merge-to is required")
+    if args.per_thread_output and not args.merge_to:
+        ap.error("--per-thread-output needs --merge-to")
 
     in_dir  = Path(args.in_dir).expanduser().resolve()
-    out_dir = Path(args.out_dir).expanduser().resolve()
-    out_dir.mkdir(parents=True, exist_ok=True)
-
     if not in_dir.exists():
         raise SystemExit(f"Input directory not found: {in_dir}")
 
-    # Single in-memory DuckDB connection (no DB file needed)
-    conn = duckdb.connect(database=':memory:')
-    conn.execute(f"PRAGMA threads={args.threads};")
-    if args.temp_directory:
-        td = sql_quote(str(Path(args.temp_directory).expanduser().resolve()))
-        conn.execute(f"PRAGMA temp_directory='{td}';")
+    cpus = os.cpu_count() or 1
+    if args.threads > 0:
+        threads = args.threads
+        jobs = args.jobs if args.jobs > 0 else max(1, cpus // threads)
+    else:
+        # Auto: one connection keeps DuckDB's default (0 = no PRAGMA); N jobs share the cores
+        jobs = max(1, args.jobs)
+        threads = max(1, cpus // jobs) if jobs > 1 else 0
+    threads_label = threads or "auto"
+    memory_limit = args.memory_limit
+    if memory_limit is None:
+        # A total budget, not per job: N connections at 8GB each would need N x 8GB
+        memory_limit = f"{DEFAULT_MEMORY_MB // (1 if args.merge_to else jobs)}MB"
+    row_group_opts = row_group_options(args.row_group_size, args.row_group_bytes)
+    # Decoder threads come on top of DuckDB's, so they share the cores across jobs too
+    decoder = decoder_command(args.decoder, max(1, cpus // jobs))
 
-    # Walk and convert
+    # Walk and collect work
     total = 0
     converted = 0
     skipped = 0
+    failed = 0
     t0_all = time.time()
 
-    for src in in_dir.rglob("*.csv"):
+    sources = list_sources(in_dir, bz2_ok=hasattr(os, "mkfifo"))
+
+    if args.merge_to:
+        dst = Path(args.merge_to).expanduser().resolve()
+        exists = any(dst.iterdir()) if dst.is_dir() else dst.exists()
+        if exists and not args.overwrite:
+            raise SystemExit(f"↷ Output exists (use --overwrite): {dst}")
+        if not sources:
+            raise SystemExit(f"No CSV files found in: {in_dir}")
+        # DuckDB reads at most one file per thread, and a FIFO's decoder only starts once DuckDB
+        # opens it: at most `threads` decoders run at once, so they share the cores between them
+        n_bz2 = sum(1 for src in sources if src.suffix.lower() == ".bz2")
+        decoder = decoder_command(args.decoder, max(1, cpus // max(1, min(n_bz2, threads or cpus))))
+        print(f"→ Merging {len(sources)} file(s) into {dst} | threads={threads_label}")
+        try:
+            secs = merge_worker(sources, dst, args.compression, args.level, args.ignore_errors,
+                                args.sample_size, row_group_opts, threads, memory_limit,
+                                args.temp_directory, args.read_buffer_size, args.per_thread_output,
+                                decoder)
+        except Exception as e:
+            raise SystemExit(f"✖ Failed: {dst}  |  Reason: {e}")
+        print(f"✔ Wrote: {dst / '*.parquet' if args.per_thread_output else dst}  |  {secs:.1f}s")
+        print(f"\nDone. Merged: {len(sources)}, Elapsed: {(time.time() - t0_all)/3600:.2f} h")
+        return
+
+    out_dir = Path(args.out_dir).expanduser().resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    todo = []
+    claimed = {}  # dst -> src; x.csv and x.csv.bz2 would both write x.parquet
+    for src in sources:
         rel = src.relative_to(in_dir)
+        if src.suffix.lower() == ".bz2":
+            rel = rel.with_suffix("")
         dst = out_dir / rel.with_suffix(".parquet")
 
         total += 1
+        if dst in claimed:
+            print(f"↷ Skipping (same output as {claimed[dst].name}): {src}")
+            skipped += 1
+            continue
+        claimed[dst] = src
         if dst.exists() and not args.overwrite:
             print(f"↷ Skipping (exists): {dst}")
             skipped += 1
             continue
+        todo.append((src, dst))
 
-        print(f"→ Converting: {src}")
-        t0 = time.time()
+    read_opts = None
+    if args.sniff_once and todo:
+        src = todo[0][0]
+        conn = open_conn(threads, memory_limit, args.temp_directory)
         try:
-            convert_one(conn, src, dst, args.compression, args.level, args.ignore_errors)
-            secs = time.time() - t0
+            with csv_source(src, args.temp_directory, args.read_buffer_size, decoder) as path:
+                read_opts = sniff_read_options(conn, path, args.sample_size)
+        finally:
+            conn.close()
+        print(f"→ Schema sniffed once from: {src}")
+
+    print(f"→ Converting {len(todo)} file(s) | jobs={jobs} | threads/job={threads_label} | "
+          f"memory/job={memory_limit or 'default'}")
+
+    # Each CSV is an independent COPY, so convert several at once
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        futures = {
+            ex.submit(convert_worker, src, dst, args.compression, args.level,
+                      args.ignore_errors, args.sample_size, row_group_opts,
+                      threads, memory_limit, args.temp_directory,
+                      args.read_buffer_size, read_opts, decoder, jobs == 1): (src, dst)
+            for src, dst in todo
+        }
+        for fut in as_completed(futures):
+            src, dst = futures[fut]
+            try:
+                secs = fut.result()
+            except Exception as e:
+                print(f"✖ Failed: {src}  |  Reason: {e}")
+                failed += 1
+                continue
             # Throughput estimate (best-effort; uses CSV size on disk)
             try:
                 size_bytes = src.stat().st_size
@@ -113,11 +486,10 @@ def main():
             except Exception:
                 print(f"✔ Wrote: {dst}  |  {secs:.1f}s")
             converted += 1
-        except Exception as e:
-            print(f"✖ Failed: {src}  |  Reason: {e}")
 
     secs_all = time.time() - t0_all
-    print(f"\nDone. Total: {total}, Converted: {converted}, Skipped: {skipped}, Elapsed: {secs_all/3600:.2f} h")
+    print(f"\nDone. Total: {total}, Converted: {converted}, Skipped: {skipped}, "
+          f"Failed: {failed}, Elapsed: {secs_all/3600:.2f} h")
 
 if __name__ == "__main__":
     main()